@@ -2,10 +2,17 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import torch
 import torch.nn as nn
-from transformers import BertTokenizer, BertModel, AutoTokenizer, AutoModel
+import torch.nn.functional as F
+from transformers import AutoTokenizer, AutoModel
 import numpy as np
 import uvicorn
 import logging
+import os
+
+from keyword_matcher import KeywordMatcher
+from micro_batcher import MicroBatcher
+from response_cache import LRUCache, normalize_text, text_cache_key
+from torch_runtime import configure_cpu_threads, supports_bf16_matmul, supports_int8_matmul
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,12 +20,91 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="CNN-BERT Harm Detection Service")
 
+configure_cpu_threads()
+
+# DistilBERT keeps ~97% of BERT-base embedding quality at 60% of the latency,
+# and its 768-dim hidden states feed either classifier head unchanged
+BERT_MODEL_NAME = 'distilbert-base-uncased'
+
+# Micro-batching: requests arriving within MAX_WAIT_MS share a forward pass,
+# run in length-sorted buckets of BUCKET_SIZE to limit padding
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 5
+BUCKET_SIZE = 8
+
+# Classifier head over BERT embeddings: 'mlp' (default) mean-pools the sequence
+# into one 768-vector for a small MLP; 'cnn' keeps the original convolutional head
+HARM_CLASSIFIER_HEAD = os.getenv('HARM_CLASSIFIER_HEAD', 'mlp').lower()
+
+# Keyword groups used for pattern-based harm detection
+HARM_PATTERNS = {
+    'violence': {
+        'keywords': ['kill', 'attack', 'destroy', 'burn', 'fight', 'harm', 'hurt', 'revenge', 
+                    'murder', 'assault', 'beat', 'strike', 'eliminate', 'annihilate'],
+        'weight': 1.5
+    },
+    'medical_misinfo': {
+        'keywords': ['poison', 'vaccine', 'cure', 'treatment', 'deadly', 'toxic', 'dangerous',
+                    'medicine', 'drug', 'disease', 'virus', 'bacteria', 'infection'],
+        'weight': 1.3
+    },
+    'conspiracy': {
+        'keywords': ['they', 'hiding', 'control', 'plan', 'secret', 'truth', 'cover-up',
+                    'agenda', 'manipulation', 'scheme', 'plot', 'conspiracy'],
+        'weight': 1.2
+    },
+    'urgency': {
+        'keywords': ['urgent', 'now', 'immediately', 'before', 'late', 'hurry', 'quick',
+                    'asap', 'emergency', 'critical', 'act now'],
+        'weight': 1.1
+    },
+    'cta': {
+        'keywords': ['share', 'forward', 'spread', 'tell', 'warn', 'alert', 'boycott',
+                    'repost', 'circulate', 'distribute', 'pass on'],
+        'weight': 1.4
+    },
+    'fear': {
+        'keywords': ['scared', 'fear', 'afraid', 'terror', 'panic', 'worry', 'threat',
+                    'danger', 'risk', 'unsafe', 'vulnerable'],
+        'weight': 1.2
+    },
+    'hate_speech': {
+        'keywords': ['hate', 'enemy', 'traitor', 'betrayal', 'against us', 'them vs us',
+                    'inferior', 'superior', 'pure', 'contaminated'],
+        'weight': 1.6
+    },
+    'misinformation_markers': {
+        'keywords': ['fake news', 'mainstream media', 'they don\'t want you to know',
+                    'censored', 'banned', 'suppressed', 'hidden truth'],
+        'weight': 1.3
+    }
+}
+
+# Immutable (category, keywords, weight) view of HARM_PATTERNS so requests
+# iterate plain tuples instead of nested dict lookups
+_PATTERNS = tuple(
+    (category, tuple(config['keywords']), config['weight'])
+    for category, config in HARM_PATTERNS.items()
+)
+
+# All keywords compiled once so each request scans the text a single time
+harm_keyword_matcher = KeywordMatcher(
+    kw for _, keywords, _ in _PATTERNS for kw in keywords
+)
+
+# Models run on the GPU when one is available
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
 # Global variables for models
 tokenizer = None
 bert_model = None
-cnn_model = None
+classifier_head = None
+harm_pipeline = None
 USE_FALLBACK = True
 
+# Predictions for recently seen texts; reposted content often arrives many times
+prediction_cache = LRUCache(maxsize=4096)
+
 # Define CNN model for pattern detection
 class CNNHarmClassifier(nn.Module):
     def __init__(self, embedding_dim=768, num_filters=128, filter_sizes=[2, 3, 4, 5]):
@@ -27,6 +113,13 @@ class CNNHarmClassifier(nn.Module):
             nn.Conv1d(in_channels=embedding_dim, out_channels=num_filters, kernel_size=fs)
             for fs in filter_sizes
         ])
+        self.max_filter_size = max(filter_sizes)
+        # Filter size behind each output channel of the fused convolution
+        self.register_buffer(
+            'channel_filter_sizes',
+            torch.tensor(filter_sizes).repeat_interleave(num_filters),
+            persistent=False
+        )
         self.fc1 = nn.Linear(len(filter_sizes) * num_filters, 256)
         self.fc2 = nn.Linear(256, 64)
         self.fc3 = nn.Linear(64, 1)
@@ -34,18 +127,30 @@ class CNNHarmClassifier(nn.Module):
         self.sigmoid = nn.Sigmoid()
         self.relu = nn.ReLU()
     
-    def forward(self, x):
+    def forward(self, x, attention_mask=None):
         # x shape: (batch_size, seq_len, embedding_dim)
         x = x.permute(0, 2, 1)  # (batch_size, embedding_dim, seq_len)
+        seq_len = x.size(2)
         
-        # Apply convolutions with ReLU
-        conv_outputs = [torch.relu(conv(x)) for conv in self.convs]
+        # Run all filter sizes as one convolution. Right-padding the input lets
+        # every filter start at every position, giving (batch_size, channels, seq_len)
+        x = F.pad(x, (0, self.max_filter_size - 1))
+        conv_out = torch.relu(F.conv1d(x, self._fused_weight(), self._fused_bias()))
         
-        # Max pooling over time
-        pooled = [torch.max(conv_out, dim=2)[0] for conv_out in conv_outputs]
+        # Drop windows that run past each sequence's end, into the right-padding
+        # or a padded batch. The first window is always kept so sequences shorter
+        # than a filter still pool. ReLU outputs are non-negative, so zeroing
+        # dropped windows never wins the max.
+        if attention_mask is None:
+            lengths = torch.full((x.size(0), 1), seq_len, dtype=torch.long, device=x.device)
+        else:
+            lengths = attention_mask.sum(dim=1, keepdim=True)
+        positions = torch.arange(seq_len, device=x.device).view(1, 1, -1)
+        last_start = (lengths.unsqueeze(2) - self.channel_filter_sizes.view(1, -1, 1)).clamp(min=0)
+        conv_out = conv_out.masked_fill(positions > last_start, 0.0)
         
-        # Concatenate all pooled features
-        cat = torch.cat(pooled, dim=1)
+        # Max pooling over time; channels are already concatenated across filter sizes
+        cat = torch.max(conv_out, dim=2)[0]
         
         # Multi-layer perceptron with dropout
         x = self.dropout(cat)
@@ -56,18 +161,105 @@ class CNNHarmClassifier(nn.Module):
         output = self.sigmoid(self.fc3(x))
         
         return output
+    
+    def _fused_weight(self):
+        # Zero-pad each kernel's trailing taps to the widest filter size; under
+        # torch.jit.freeze this folds to a constant
+        return torch.cat([
+            F.pad(conv.weight, (0, self.max_filter_size - conv.kernel_size[0]))
+            for conv in self.convs
+        ], dim=0)
+    
+    def _fused_bias(self):
+        return torch.cat([conv.bias for conv in self.convs], dim=0)
+
+
+class MeanPoolHarmClassifier(nn.Module):
+    """MLP over the attention-masked mean of the token embeddings"""
+    def __init__(self, embedding_dim=768, hidden_dim=256):
+        super(MeanPoolHarmClassifier, self).__init__()
+        self.mlp = nn.Sequential(
+            nn.Linear(embedding_dim, hidden_dim),
+            nn.ReLU(),
+            nn.Dropout(0.3),
+            nn.Linear(hidden_dim, 1),
+            nn.Sigmoid()
+        )
+    
+    def forward(self, x, attention_mask=None):
+        # x shape: (batch_size, seq_len, embedding_dim)
+        if attention_mask is None:
+            pooled = x.mean(dim=1)
+        else:
+            mask = attention_mask.unsqueeze(2).to(x.dtype)
+            pooled = (x * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        
+        return self.mlp(pooled)
+
+
+class BertHarmPipeline(nn.Module):
+    """BERT encoder followed by the classifier head, traced as one graph"""
+    def __init__(self, bert, head):
+        super(BertHarmPipeline, self).__init__()
+        self.bert = bert
+        self.head = head
+    
+    def forward(self, input_ids, attention_mask):
+        embeddings = self.bert(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            return_dict=False
+        )[0]
+        return self.head(embeddings.float(), attention_mask)
+
+
+def pad_batch(input_ids):
+    """Pad token id lists into BERT input tensors of the batch's longest length"""
+    # Lengths are rounded up to a multiple of 8 so every input is wider than
+    # the largest CNN filter, which keeps the traced graph shape-agnostic
+    inputs = tokenizer.pad(
+        {'input_ids': input_ids},
+        padding=True,
+        pad_to_multiple_of=8,
+        return_tensors='pt'
+    )
+    
+    if device.type != 'cuda':
+        return inputs
+    # Copy from pinned memory so the host-to-device transfer runs asynchronously
+    return {k: v.pin_memory().to(device, non_blocking=True) for k, v in inputs.items()}
+
+
+def build_harm_pipeline():
+    """Trace and freeze BERT + classifier head so TorchScript can fuse ops across both"""
+    examples = tokenizer(
+        ["Share this before they delete it, the truth is being hidden from us.",
+         "Wake up!"],
+        truncation=True,
+        max_length=512
+    )['input_ids']
+    example = pad_batch(examples)
+    pipeline = BertHarmPipeline(bert_model, classifier_head).eval()
+    # no_grad rather than inference_mode: inference tensors must not be baked into the trace
+    with torch.no_grad():
+        traced = torch.jit.trace(pipeline, (example['input_ids'], example['attention_mask']))
+    return torch.jit.freeze(traced)
 
 # Initialize models
 logger.info("Loading CNN-BERT hybrid model...")
 try:
     # Try loading BERT model
     logger.info("Loading BERT tokenizer and model...")
-    tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-    bert_model = BertModel.from_pretrained('bert-base-uncased')
+    tokenizer = AutoTokenizer.from_pretrained(BERT_MODEL_NAME, use_fast=True)
+    bert_model = AutoModel.from_pretrained(BERT_MODEL_NAME)
     
-    # Initialize CNN model
-    cnn_model = CNNHarmClassifier()
-    cnn_model.eval()
+    # Initialize classifier head
+    if HARM_CLASSIFIER_HEAD == 'cnn':
+        classifier_head = CNNHarmClassifier()
+    else:
+        classifier_head = MeanPoolHarmClassifier()
+    classifier_head.eval()
+    logger.info(f"Using {type(classifier_head).__name__} head")
     
     # Set BERT to evaluation mode
     bert_model.eval()
@@ -76,6 +268,38 @@ try:
     for param in bert_model.parameters():
         param.requires_grad = False
     
+    # On GPU, allow TF32 matmuls and run BERT in fp16 on Ampere+ tensor cores.
+    # On CPU, run BERT in bf16 where there are native bf16 matmuls; otherwise
+    # quantize its Linear layers to int8. Quantized Linear only accepts fp32
+    # activations, so the two are alternatives. The classifier head stays fp32.
+    if device.type == 'cuda':
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        if torch.cuda.get_device_capability(device) >= (8, 0):
+            bert_model = bert_model.half()
+            logger.info("✅ BERT weights cast to float16")
+    elif supports_bf16_matmul():
+        bert_model = bert_model.to(torch.bfloat16)
+        logger.info("✅ BERT weights cast to bfloat16")
+    elif supports_int8_matmul():
+        torch.backends.quantized.engine = 'fbgemm'
+        bert_model = torch.ao.quantization.quantize_dynamic(
+            bert_model, {nn.Linear}, dtype=torch.qint8
+        )
+        logger.info("✅ BERT Linear layers quantized to int8")
+    
+    bert_model = bert_model.to(device)
+    classifier_head = classifier_head.to(device)
+    logger.info(f"Running on {device}")
+    
+    # Fuse both models into one TorchScript graph; keep the eager path if tracing fails
+    try:
+        harm_pipeline = build_harm_pipeline()
+        logger.info("✅ BERT + classifier head traced into a fused TorchScript graph")
+    except Exception as e:
+        logger.warning(f"⚠️ TorchScript tracing failed, using eager models: {e}")
+        harm_pipeline = None
+    
     logger.info("✅ CNN-BERT model loaded successfully!")
     USE_FALLBACK = False
     
@@ -84,7 +308,8 @@ except Exception as e:
     logger.info("Running in Fallback Mode (Pattern-based detection)")
     tokenizer = None
     bert_model = None
-    cnn_model = None
+    classifier_head = None
+    harm_pipeline = None
     USE_FALLBACK = True
 
 
@@ -99,84 +324,61 @@ class HarmPrediction(BaseModel):
     cnn_patterns: list
 
 
-def extract_bert_features(text: str):
-    """Extract BERT embeddings from text"""
-    if USE_FALLBACK or not tokenizer or not bert_model:
-        return None
+def extract_bert_features(inputs):
+    """Extract BERT embeddings from tokenized inputs"""
+    with torch.inference_mode():
+        outputs = bert_model(**inputs)
+        # Cast back from bf16 (a no-op for fp32) since the classifier head runs in fp32
+        embeddings = outputs.last_hidden_state.float()  # (batch_size, seq_len, 768)
     
+    return embeddings
+
+
+def run_harm_batch(texts: list):
+    """Run BERT + classifier head over texts, returning (cnn_score, sequence_length) per text"""
     try:
-        # Tokenize with proper padding and truncation
-        inputs = tokenizer(
-            text, 
-            return_tensors='pt', 
-            truncation=True, 
-            max_length=512, 
-            padding='max_length'
-        )
+        input_ids = tokenizer(texts, truncation=True, max_length=512)['input_ids']
         
-        # Get BERT embeddings
-        with torch.no_grad():
-            outputs = bert_model(**inputs)
-            embeddings = outputs.last_hidden_state  # (1, seq_len, 768)
+        # Bucket by token length so each sub-batch pads as little as possible
+        order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]))
+        bucket_scores = []
         
-        return embeddings
+        for start in range(0, len(order), BUCKET_SIZE):
+            bucket = order[start:start + BUCKET_SIZE]
+            inputs = pad_batch([input_ids[i] for i in bucket])
+            
+            with torch.inference_mode():
+                if harm_pipeline is not None:
+                    head_output = harm_pipeline(inputs['input_ids'], inputs['attention_mask'])
+                else:
+                    embeddings = extract_bert_features(inputs)
+                    head_output = classifier_head(embeddings, inputs['attention_mask'])
+            
+            bucket_scores.append(head_output.squeeze(1))
+        
+        # Scores stay as tensors until the whole batch is done, then come back
+        # to Python in a single transfer (in length-sorted order)
+        results = [None] * len(texts)
+        for i, score in zip(order, torch.cat(bucket_scores).tolist()):
+            results[i] = (score, len(input_ids[i]))
+        
+        return results
     except Exception as e:
-        logger.error(f"Error extracting BERT features: {e}")
-        return None
+        logger.error(f"Error running CNN-BERT batch: {e}")
+        return [None] * len(texts)
+
+
+# Concurrent /predict calls share one BERT forward pass
+harm_batcher = MicroBatcher(run_harm_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS)
 
 
 def detect_harm_patterns(text: str):
     """Detect harmful patterns using comprehensive keyword analysis"""
-    text_lower = text.lower()
-    
-    patterns = {
-        'violence': {
-            'keywords': ['kill', 'attack', 'destroy', 'burn', 'fight', 'harm', 'hurt', 'revenge', 
-                        'murder', 'assault', 'beat', 'strike', 'eliminate', 'annihilate'],
-            'weight': 1.5
-        },
-        'medical_misinfo': {
-            'keywords': ['poison', 'vaccine', 'cure', 'treatment', 'deadly', 'toxic', 'dangerous',
-                        'medicine', 'drug', 'disease', 'virus', 'bacteria', 'infection'],
-            'weight': 1.3
-        },
-        'conspiracy': {
-            'keywords': ['they', 'hiding', 'control', 'plan', 'secret', 'truth', 'cover-up',
-                        'agenda', 'manipulation', 'scheme', 'plot', 'conspiracy'],
-            'weight': 1.2
-        },
-        'urgency': {
-            'keywords': ['urgent', 'now', 'immediately', 'before', 'late', 'hurry', 'quick',
-                        'asap', 'emergency', 'critical', 'act now'],
-            'weight': 1.1
-        },
-        'cta': {
-            'keywords': ['share', 'forward', 'spread', 'tell', 'warn', 'alert', 'boycott',
-                        'repost', 'circulate', 'distribute', 'pass on'],
-            'weight': 1.4
-        },
-        'fear': {
-            'keywords': ['scared', 'fear', 'afraid', 'terror', 'panic', 'worry', 'threat',
-                        'danger', 'risk', 'unsafe', 'vulnerable'],
-            'weight': 1.2
-        },
-        'hate_speech': {
-            'keywords': ['hate', 'enemy', 'traitor', 'betrayal', 'against us', 'them vs us',
-                        'inferior', 'superior', 'pure', 'contaminated'],
-            'weight': 1.6
-        },
-        'misinformation_markers': {
-            'keywords': ['fake news', 'mainstream media', 'they don\'t want you to know',
-                        'censored', 'banned', 'suppressed', 'hidden truth'],
-            'weight': 1.3
-        }
-    }
+    found = harm_keyword_matcher.find(text.lower())
     
     detected = []
-    for category, config in patterns.items():
-        keywords = config['keywords']
-        weight = config['weight']
-        matches = [kw for kw in keywords if kw in text_lower]
+    for category, keywords, weight in _PATTERNS:
+        matches = [kw for kw in keywords if kw in found]
         if matches:
             # Calculate weighted score
             base_score = len(matches) / len(keywords)
@@ -190,12 +392,11 @@ def detect_harm_patterns(text: str):
     return detected
 
 
-@app.post("/predict", response_model=HarmPrediction)
-async def predict_harm(input_data: TextInput):
-    """Predict harm score using CNN-BERT hybrid model"""
+def compute_harm_prediction(text: str, model_output) -> HarmPrediction:
+    """Score text from the CNN-BERT (cnn_score, sequence_length) output and keyword patterns"""
     try:
         # Detect patterns first (works in both modes)
-        patterns = detect_harm_patterns(input_data.text)
+        patterns = detect_harm_patterns(text)
         
         if USE_FALLBACK:
             # Fallback: Use enhanced pattern-based scoring
@@ -206,7 +407,7 @@ async def predict_harm(input_data: TextInput):
                 harm_score = min(total_weight / max(len(patterns), 1), 1.0)
             
             # Adjust based on text characteristics
-            word_count = len(input_data.text.split())
+            word_count = len(text.split())
             if word_count > 50:
                 harm_score = min(harm_score * 1.15, 1.0)
             
@@ -227,10 +428,7 @@ async def predict_harm(input_data: TextInput):
         # Full CNN-BERT mode
         logger.info("Running CNN-BERT prediction...")
         
-        # Extract BERT features
-        bert_embeddings = extract_bert_features(input_data.text)
-        
-        if bert_embeddings is None:
+        if model_output is None:
             logger.warning("BERT feature extraction failed, using fallback")
             # Fall back to pattern-based scoring
             harm_score = 0.0
@@ -245,10 +443,7 @@ async def predict_harm(input_data: TextInput):
                 cnn_patterns=patterns
             )
         
-        # Run CNN model
-        with torch.no_grad():
-            cnn_output = cnn_model(bert_embeddings)
-            cnn_harm_score = cnn_output.item()
+        cnn_harm_score, sequence_length = model_output
         
         logger.info(f"CNN harm score: {cnn_harm_score:.3f}")
         
@@ -274,8 +469,8 @@ async def predict_harm(input_data: TextInput):
             harm_score=round(final_score, 3),
             confidence=round(confidence, 3),
             bert_features={
-                'embedding_dim': bert_embeddings.shape[-1],
-                'sequence_length': bert_embeddings.shape[1],
+                'embedding_dim': bert_model.config.hidden_size,
+                'sequence_length': sequence_length,
                 'pattern_count': len(patterns),
                 'cnn_score': round(cnn_harm_score, 3)
             },
@@ -285,7 +480,7 @@ async def predict_harm(input_data: TextInput):
     except Exception as e:
         logger.error(f"Error predicting harm: {e}", exc_info=True)
         # Return safe fallback response
-        patterns = detect_harm_patterns(input_data.text)
+        patterns = detect_harm_patterns(text)
         harm_score = 0.3 if patterns else 0.1
         
         return HarmPrediction(
@@ -296,6 +491,30 @@ async def predict_harm(input_data: TextInput):
         )
 
 
+@app.post("/predict", response_model=HarmPrediction)
+async def predict_harm(input_data: TextInput):
+    """Predict harm score using CNN-BERT hybrid model"""
+    text = normalize_text(input_data.text)
+    
+    # Patterns and the uncased tokenizer both ignore case, so it is left out of the key
+    cache_key = text_cache_key(text.lower())
+    cached = prediction_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    model_output = None
+    if not USE_FALLBACK:
+        model_output = await harm_batcher.submit(text)
+    
+    prediction = compute_harm_prediction(text, model_output)
+    
+    # Don't memoize responses produced by a failed model run
+    if 'error' not in prediction.bert_features:
+        prediction_cache.put(cache_key, prediction)
+    
+    return prediction
+
+
 @app.get("/health")
 async def health_check():
     return {
@@ -1,30 +1,55 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from transformers import pipeline
 import torch
+import functools
+import re
 import uvicorn
 
-app = FastAPI(title="Emotion Detection Service")
-
-# Initialize emotion classification model
-print("Loading emotion detection model...")
-try:
-    from transformers import pipeline
-    import torch
-    # Using a pretrained emotion classifier
-    emotion_classifier = pipeline(
-        "text-classification",
-        model="j-hartmann/emotion-english-distilroberta-base",
-        return_all_scores=True,
-        device=0 if torch.cuda.is_available() else -1
-    )
-    print("✅ Emotion model loaded successfully!")
-    USE_FALLBACK = False
-except Exception as e:
-    print(f"Error loading model/libraries: {e}")
-    print("Running in Fallback Mode (Simulated Emotion)")
-    emotion_classifier = None
-    USE_FALLBACK = True
+from torch_runtime import configure_cpu_threads
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the classifier cache before serving so the first /analyze call
+    # doesn't wait on the model download and load
+    _get_classifier()
+    yield
+
+
+app = FastAPI(title="Emotion Detection Service", lifespan=lifespan)
+
+configure_cpu_threads()
+
+# Single-word keywords for the fallback emotion heuristic, matched against the
+# set of words in the text
+ANGER_WORDS = frozenset({'poison', 'kill', 'hate', 'stupid', 'anger'})
+FEAR_WORDS = frozenset({'scared', 'fear', 'deadly', 'warning'})
+JOY_WORDS = frozenset({'happy', 'great', 'good', 'joy'})
+SADNESS_WORDS = frozenset({'sad', 'cry', 'tragedy'})
+
+WORD_RE = re.compile(r"[a-z']+")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_classifier():
+    """Load the emotion classifier once per process on first call; None means fallback mode"""
+    print("Loading emotion detection model...")
+    try:
+        # Using a pretrained emotion classifier
+        classifier = pipeline(
+            "text-classification",
+            model="j-hartmann/emotion-english-distilroberta-base",
+            return_all_scores=True,
+            device=0 if torch.cuda.is_available() else -1
+        )
+        print("✅ Emotion model loaded successfully!")
+        return classifier
+    except Exception as e:
+        print(f"Error loading model/libraries: {e}")
+        print("Running in Fallback Mode (Simulated Emotion)")
+        return None
 
 
 class TextInput(BaseModel):
@@ -41,35 +66,26 @@ class EmotionScores(BaseModel):
 
 @app.post("/analyze", response_model=EmotionScores)
 async def analyze_emotion(input_data: TextInput):
-    """Analyze emotional content of text"""
     """Analyze emotional content of text"""
     try:
-        if USE_FALLBACK:
+        emotion_classifier = _get_classifier()
+        
+        if emotion_classifier is None:
             # Simple keyword heuristic for fallback
-            text_lower = input_data.text.lower()
+            words = set(WORD_RE.findall(input_data.text.lower()))
             scores = {'anger': 0.1, 'fear': 0.1, 'joy': 0.2, 'sadness': 0.1, 'neutral': 0.5}
             
-            if any(w in text_lower for w in ['poision', 'kill', 'hate', 'stupid', 'anger']):
+            if not ANGER_WORDS.isdisjoint(words):
                 scores['anger'] = 0.7; scores['neutral'] = 0.1
-            if any(w in text_lower for w in ['scared', 'fear', 'deadly', 'warning']):
+            if not FEAR_WORDS.isdisjoint(words):
                 scores['fear'] = 0.7; scores['neutral'] = 0.1
-            if any(w in text_lower for w in ['happy', 'great', 'good', 'joy']):
+            if not JOY_WORDS.isdisjoint(words):
                 scores['joy'] = 0.7; scores['neutral'] = 0.1
-            if any(w in text_lower for w in ['sad', 'cry', 'tragedy']):
+            if not SADNESS_WORDS.isdisjoint(words):
                 scores['sadness'] = 0.7; scores['neutral'] = 0.1
                 
             return EmotionScores(**scores)
 
-        if not emotion_classifier:
-             # Fallback to mock data if model not loaded (but USE_FALLBACK=False? shouldn't happen)
-            return EmotionScores(
-                anger=0.1,
-                fear=0.1,
-                joy=0.3,
-                sadness=0.1,
-                neutral=0.4
-            )
-
         # Get predictions
         results = emotion_classifier(input_data.text[:512])[0]
         
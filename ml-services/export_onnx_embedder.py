@@ -0,0 +1,29 @@
+"""Export all-MiniLM-L6-v2 to ONNX and quantize it to INT8 for rag_service.py
+
+Usage: python export_onnx_embedder.py [output_dir]   (default: ./onnx)
+"""
+from pathlib import Path
+import sys
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+def export(output_dir: Path):
+    print(f"Exporting {EMBEDDING_MODEL_NAME} to ONNX...")
+    model = ORTModelForFeatureExtraction.from_pretrained(EMBEDDING_MODEL_NAME, export=True)
+    model.save_pretrained(output_dir)
+
+    print("Quantizing weights to INT8...")
+    quantize_dynamic(
+        str(output_dir / 'model.onnx'),
+        str(output_dir / 'model_int8.onnx'),
+        weight_type=QuantType.QUInt8
+    )
+    print(f"✅ Saved {output_dir / 'model_int8.onnx'}")
+
+
+if __name__ == "__main__":
+    export(Path(sys.argv[1] if len(sys.argv) > 1 else 'onnx'))
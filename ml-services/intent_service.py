@@ -1,30 +1,101 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from transformers import pipeline
 import torch
+import functools
 import re
 import uvicorn
 
-app = FastAPI(title="Intent Classification Service")
-
-# Initialize toxicity/intent classifier
-print("Loading intent classification model...")
-try:
-    from transformers import pipeline
-    import torch
-    # Using toxicity classifier as proxy for intent detection
-    toxicity_classifier = pipeline(
-        "text-classification",
-        model="unitary/toxic-bert",
-        device=0 if torch.cuda.is_available() else -1
-    )
-    print("✅ Intent model loaded successfully!")
-    USE_FALLBACK = False
-except Exception as e:
-    print(f"Error loading model/libraries: {e}")
-    print("Running in Fallback Mode (Simulated Intent)")
-    toxicity_classifier = None
-    USE_FALLBACK = True
+from keyword_matcher import KeywordMatcher
+from torch_runtime import configure_cpu_threads
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load toxic-bert up front; requests would otherwise trigger it lazily
+    _get_classifier()
+    yield
+
+
+app = FastAPI(title="Intent Classification Service", lifespan=lifespan)
+
+configure_cpu_threads()
+
+# Single-word keywords for intent heuristics, matched against the set of words in the text
+ALARMIST_WORDS = frozenset({'urgent', 'emergency', 'crisis', 'disaster', 'danger', 'threat', 'warning'})
+INCITING_WORDS = frozenset({'attack', 'fight', 'destroy', 'burn', 'kill', 'harm', 'revenge'})
+PERSUASIVE_WORDS = frozenset({'should', 'must', 'convince'})
+
+WORD_RE = re.compile(r"[a-z']+")
+
+# Multi-word phrases and substring keywords go through the keyword matcher
+PERSUASIVE_PHRASES = ['need to']
+TOXIC_KEYWORDS = ['toxic', 'hate', 'stupid', 'idiot', 'kill', 'destroy']
+
+# Both lists compiled into one matcher so each request scans the text once
+intent_keyword_matcher = KeywordMatcher(PERSUASIVE_PHRASES + TOXIC_KEYWORDS)
+
+# Explicit CTA patterns
+EXPLICIT_CTA_PATTERNS = [
+    r'\bshare\s+(this|now|urgently|immediately)',
+    r'\bforward\s+(this|now|urgently)',
+    r'\bspread\s+(the\s+word|awareness)',
+    r'\bboycott\b',
+    r'\bprotest\b',
+    r'\btake\s+action',
+    r'\bmust\s+(do|act|share|stop)',
+    r'\bdo\s+not\s+(take|believe|trust)',
+]
+
+# Implicit CTA patterns
+IMPLICIT_CTA_PATTERNS = [
+    r'\byou\s+(should|need\s+to|must)',
+    r'\beveryone\s+(should|needs\s+to|must)',
+    r'\bwe\s+(should|need\s+to|must)',
+    r'\bdon\'t\s+let\b',
+    r'\bbefore\s+it\'s\s+too\s+late',
+    r'\bwake\s+up',
+    r'\bthink\s+about',
+]
+
+# Dog whistle indicators
+DOG_WHISTLE_PATTERNS = [
+    r'\bthey\b.*\bplanning',
+    r'\bthey\b.*\bhiding',
+    r'\bthey\b.*\bcontrol',
+    r'\bthey\s+don\'t\s+want\s+you\s+to\s+know',
+    r'\bthe\s+truth\b.*\bhidden',
+    r'\bwake\s+up\s+sheeple',
+    r'\bdo\s+your\s+own\s+research',
+    r'\bmainstream\s+media.*\blying',
+]
+
+# CTA groups only need a yes/no answer, so each compiles to a single alternation
+# scanned once; dog whistles are counted individually
+EXPLICIT_CTA_RE = re.compile('|'.join(f'(?:{p})' for p in EXPLICIT_CTA_PATTERNS))
+IMPLICIT_CTA_RE = re.compile('|'.join(f'(?:{p})' for p in IMPLICIT_CTA_PATTERNS))
+DOG_WHISTLE_RES = tuple(re.compile(p) for p in DOG_WHISTLE_PATTERNS)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_classifier():
+    """Load the toxicity classifier on first use and reuse it for the life of the process
+    (None if loading failed, which puts /analyze on the keyword heuristics)"""
+    print("Loading intent classification model...")
+    try:
+        # Using toxicity classifier as proxy for intent detection
+        classifier = pipeline(
+            "text-classification",
+            model="unitary/toxic-bert",
+            device=0 if torch.cuda.is_available() else -1
+        )
+        print("✅ Intent model loaded successfully!")
+        return classifier
+    except Exception as e:
+        print(f"Error loading model/libraries: {e}")
+        print("Running in Fallback Mode (Simulated Intent)")
+        return None
 
 
 class TextInput(BaseModel):
@@ -42,32 +113,8 @@ def detect_call_to_action(text: str):
     """Detect explicit and implicit calls to action"""
     text_lower = text.lower()
     
-    # Explicit CTA patterns
-    explicit_patterns = [
-        r'\bshare\s+(this|now|urgently|immediately)',
-        r'\bforward\s+(this|now|urgently)',
-        r'\bspread\s+(the\s+word|awareness)',
-        r'\bboycott\b',
-        r'\bprotest\b',
-        r'\btake\s+action',
-        r'\bmust\s+(do|act|share|stop)',
-        r'\bdo\s+not\s+(take|believe|trust)',
-    ]
-    
-    hasExplicitCTA = any(re.search(pattern, text_lower) for pattern in explicit_patterns)
-    
-    # Implicit CTA patterns
-    implicit_patterns = [
-        r'\byou\s+(should|need\s+to|must)',
-        r'\beveryone\s+(should|needs\s+to|must)',
-        r'\bwe\s+(should|need\s+to|must)',
-        r'\bdon\'t\s+let\b',
-        r'\bbefore\s+it\'s\s+too\s+late',
-        r'\bwake\s+up',
-        r'\bthink\s+about',
-    ]
-    
-    hasImplicitCTA = any(re.search(pattern, text_lower) for pattern in implicit_patterns)
+    hasExplicitCTA = EXPLICIT_CTA_RE.search(text_lower) is not None
+    hasImplicitCTA = IMPLICIT_CTA_RE.search(text_lower) is not None
     
     return hasExplicitCTA, hasImplicitCTA
 
@@ -76,33 +123,20 @@ def detect_dog_whistle(text: str):
     """Detect potential coded language or dog whistles"""
     text_lower = text.lower()
     
-    # Dog whistle indicators
-    dog_whistle_patterns = [
-        r'\bthey\b.*\bplanning',
-        r'\bthey\b.*\bhiding',
-        r'\bthey\b.*\bcontrol',
-        r'\bthey\s+don\'t\s+want\s+you\s+to\s+know',
-        r'\bthe\s+truth\b.*\bhidden',
-        r'\bwake\s+up\s+sheeple',
-        r'\bdo\s+your\s+own\s+research',
-        r'\bmainstream\s+media.*\blying',
-    ]
-    
-    matches = sum(1 for pattern in dog_whistle_patterns if re.search(pattern, text_lower))
-    return min(matches / len(dog_whistle_patterns), 1.0)
+    matches = sum(1 for pattern in DOG_WHISTLE_RES if pattern.search(text_lower))
+    return min(matches / len(DOG_WHISTLE_RES), 1.0)
 
 
 def classify_intent_type(text: str, toxicity_score: float, has_cta: bool):
     """Classify the intent type based on text features"""
     text_lower = text.lower()
+    words = set(WORD_RE.findall(text_lower))
     
     # Check for alarmist language
-    alarmist_keywords = ['urgent', 'emergency', 'crisis', 'disaster', 'danger', 'threat', 'warning']
-    alarmist_count = sum(1 for kw in alarmist_keywords if kw in text_lower)
+    alarmist_count = len(ALARMIST_WORDS & words)
     
     # Check for inciting language
-    inciting_keywords = ['attack', 'fight', 'destroy', 'burn', 'kill', 'harm', 'revenge']
-    inciting_count = sum(1 for kw in inciting_keywords if kw in text_lower)
+    inciting_count = len(INCITING_WORDS & words)
     
     # Determine intent type
     if inciting_count >= 2 or toxicity_score > 0.8:
@@ -111,7 +145,9 @@ def classify_intent_type(text: str, toxicity_score: float, has_cta: bool):
         return 'Alarmist'
     elif has_cta:
         return 'Action-oriented'
-    elif any(word in text_lower for word in ['should', 'must', 'need to', 'convince']):
+    elif not PERSUASIVE_WORDS.isdisjoint(words):
+        return 'Persuasive'
+    elif not intent_keyword_matcher.find(text_lower).isdisjoint(PERSUASIVE_PHRASES):
         return 'Persuasive'
     else:
         return 'Informational'
@@ -130,12 +166,14 @@ async def analyze_intent(input_data: TextInput):
         # Get toxicity score
         toxicity_score = 0.0
         
-        if USE_FALLBACK:
+        toxicity_classifier = _get_classifier()
+        
+        if toxicity_classifier is None:
             # Fallback toxicity heuristic
-            bad_words = ['toxic', 'hate', 'stupid', 'idiot', 'kill', 'destroy']
-            if any(w in input_data.text.lower() for w in bad_words):
+            found = intent_keyword_matcher.find(input_data.text.lower())
+            if any(w in found for w in TOXIC_KEYWORDS):
                 toxicity_score = 0.9
-        elif toxicity_classifier:
+        else:
             result = toxicity_classifier(input_data.text[:512])[0]
             if result['label'] == 'toxic':
                 toxicity_score = result['score']
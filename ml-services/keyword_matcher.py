@@ -0,0 +1,52 @@
+"""Multi-keyword substring matching shared by the ML services"""
+import re
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class KeywordMatcher:
+    """Find which of a fixed set of keywords occur in a text in a single pass.
+
+    Keywords are compiled into one Aho-Corasick automaton when pyahocorasick is
+    installed; otherwise into one precompiled regex alternation. Both paths
+    match substrings, like ``keyword in text``.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(keywords))
+        self.automaton = None
+        self.pattern = None
+
+        if not self.keywords:
+            return
+
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self.automaton.add_word(keyword, keyword)
+            self.automaton.make_automaton()
+        else:
+            # A lookahead finds the longest keyword starting at each position
+            # (alternatives are tried longest first); keywords nested inside a
+            # match are recovered from `contained`
+            ordered = sorted(self.keywords, key=len, reverse=True)
+            self.pattern = re.compile('(?=(' + '|'.join(map(re.escape, ordered)) + '))')
+            self.contained = {
+                kw: frozenset(other for other in self.keywords if other != kw and other in kw)
+                for kw in self.keywords
+            }
+
+    def find(self, text_lower: str) -> set:
+        """Return the set of keywords found in already-lowercased text"""
+        if self.automaton is not None:
+            return {kw for _, kw in self.automaton.iter(text_lower)}
+        if self.pattern is None:
+            return set()
+
+        found = set(self.pattern.findall(text_lower))
+        for kw in tuple(found):
+            found |= self.contained[kw]
+        return found
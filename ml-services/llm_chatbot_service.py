@@ -1,9 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+import asyncio
 import uvicorn
 import logging
 
+from response_cache import LRUCache, normalize_text, text_cache_key
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,27 +18,64 @@ tokenizer = None
 model = None
 USE_FALLBACK = True
 
+# Fixed text of the explanation prompt, split around its per-request fields;
+# tokenized once at startup into prompt_segment_ids
+PROMPT_SEGMENTS = (
+    'Analyze this statement for misinformation risk:\n\nStatement: "',
+    '"\n\nAnalysis Results:\n- Harm Index:',
+    '\n- Dominant Emotion:',
+    '\n- Intent:',
+    '\n- Similarity to False Narratives:',
+    '\n\nProvide a clear, professional explanation of why this statement received this risk score:',
+)
+prompt_segment_ids = None
+
+# Responses for recently seen analyses; reposted content often arrives many times
+response_cache = LRUCache(maxsize=4096)
+
 # Initialize LLM
 logger.info("Loading LLM for explanations...")
 try:
-    from transformers import GPT2LMHeadModel, GPT2Tokenizer
+    from transformers import GPT2LMHeadModel, GPT2TokenizerFast
     import torch
+    from torch_runtime import configure_cpu_threads, supports_bf16_matmul, supports_int8_matmul
+    
+    configure_cpu_threads()
     
     # Load GPT-2 model (using smaller model for faster loading)
     model_name = "gpt2"  # Using base GPT-2 for better compatibility
     logger.info(f"Loading {model_name} model...")
     
-    tokenizer = GPT2Tokenizer.from_pretrained(model_name)
+    tokenizer = GPT2TokenizerFast.from_pretrained(model_name)
     model = GPT2LMHeadModel.from_pretrained(model_name)
     model.eval()
     
     # Set pad token
     tokenizer.pad_token = tokenizer.eos_token
     
+    prompt_segment_ids = [tokenizer.encode(segment) for segment in PROMPT_SEGMENTS]
+    
     # Disable gradient computation
     for param in model.parameters():
         param.requires_grad = False
     
+    # On GPU, run in fp16 to halve memory traffic and use tensor cores. On CPU,
+    # where fp16 is slow, run in bf16 if there are native bf16 matmuls. Otherwise
+    # quantize nn.Linear layers to int8 (GPT-2 blocks use transformers' Conv1D,
+    # so this mainly covers the vocabulary projection in lm_head)
+    if torch.cuda.is_available():
+        model = model.half().to('cuda')
+        logger.info("✅ LLM running on CUDA in float16")
+    elif supports_bf16_matmul():
+        model = model.to(torch.bfloat16)
+        logger.info("✅ LLM weights cast to bfloat16")
+    elif supports_int8_matmul():
+        torch.backends.quantized.engine = 'fbgemm'
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        logger.info("✅ LLM Linear layers quantized to int8")
+    
     logger.info("✅ LLM model loaded successfully!")
     USE_FALLBACK = False
     
@@ -44,6 +84,7 @@ except Exception as e:
     logger.info("Running in Fallback Mode (Template-based explanations)")
     tokenizer = None
     model = None
+    prompt_segment_ids = None
     USE_FALLBACK = True
 
 
@@ -122,55 +163,73 @@ def generate_template_explanation(analysis: AnalysisInput) -> str:
     return opening + emotion_text + intent_text + truth_text
 
 
-def generate_llm_explanation(analysis: AnalysisInput) -> str:
-    """Generate explanation using LLM"""
-    if USE_FALLBACK or not model or not tokenizer:
-        return generate_template_explanation(analysis)
+def build_prompt_ids(analysis: AnalysisInput):
+    """Token ids of the explanation prompt, encoding only the per-request fields"""
+    dominant_emotion = max(analysis.emotionScores.items(), key=lambda x: x[1])[0]
+    similarity = int(analysis.truthVerification.get('similarityToFalseNarratives', 0)*100)
     
-    # Create prompt for LLM
-    prompt = f"""Analyze this statement for misinformation risk:
+    # GPT-2 BPE attaches a leading space to the following word, so fields carry
+    # their own leading space to tokenize the same as the full prompt string
+    fields = (
+        analysis.text[:200],
+        f" {analysis.harmIndex}/100 ({analysis.riskLevel} Risk)",
+        f" {dominant_emotion}",
+        f" {analysis.intentAnalysis.get('type')}",
+        f" {similarity}%",
+    )
+    
+    ids = list(prompt_segment_ids[0])
+    for field, segment_ids in zip(fields, prompt_segment_ids[1:]):
+        ids += tokenizer.encode(field)
+        ids += segment_ids
+    
+    return torch.tensor([ids[:512]])
 
-Statement: "{analysis.text[:200]}"
 
-Analysis Results:
-- Harm Index: {analysis.harmIndex}/100 ({analysis.riskLevel} Risk)
-- Dominant Emotion: {max(analysis.emotionScores.items(), key=lambda x: x[1])[0]}
-- Intent: {analysis.intentAnalysis.get('type')}
-- Similarity to False Narratives: {int(analysis.truthVerification.get('similarityToFalseNarratives', 0)*100)}%
+def generate_llm_explanation(analysis: AnalysisInput):
+    """Generate explanation using LLM.
 
-Provide a clear, professional explanation of why this statement received this risk score:"""
+    Returns (explanation, failed), where failed is True when generation raised
+    and the template was substituted for this call only.
+    """
+    if USE_FALLBACK or not model or not tokenizer:
+        return generate_template_explanation(analysis), False
     
     try:
         # Tokenize
-        inputs = tokenizer(prompt, return_tensors='pt', truncation=True, max_length=512)
+        input_ids = build_prompt_ids(analysis).to(model.device)
+        attention_mask = torch.ones_like(input_ids)
         
         # Generate
-        with torch.no_grad():
+        with torch.inference_mode():
+            # Greedy decoding with the KV cache: each step only attends the new
+            # token, and identical analyses yield identical (cacheable) output
             outputs = model.generate(
-                inputs['input_ids'],
-                max_length=inputs['input_ids'].shape[1] + 150,
+                input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=80,
                 num_return_sequences=1,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
+                do_sample=False,
+                num_beams=1,
+                use_cache=True,
+                eos_token_id=tokenizer.eos_token_id,
                 pad_token_id=tokenizer.eos_token_id
             )
         
-        # Decode
-        generated = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract only the generated part (after prompt)
-        explanation = generated[len(prompt):].strip()
+        # Decode only the generated part (after prompt)
+        explanation = tokenizer.decode(
+            outputs[0][input_ids.shape[1]:], skip_special_tokens=True
+        ).strip()
         
         # If generation is too short or failed, use template
         if len(explanation) < 50:
-            return generate_template_explanation(analysis)
+            return generate_template_explanation(analysis), False
         
-        return explanation
+        return explanation, False
     
     except Exception as e:
         print(f"LLM generation error: {e}")
-        return generate_template_explanation(analysis)
+        return generate_template_explanation(analysis), True
 
 
 def generate_insights(analysis: AnalysisInput) -> list:
@@ -227,9 +286,15 @@ def generate_recommendations(analysis: AnalysisInput) -> list:
 @app.post("/explain", response_model=ChatbotResponse)
 async def explain_analysis(analysis: AnalysisInput):
     """Generate conversational explanation of analysis results"""
+    analysis = analysis.model_copy(update={'text': normalize_text(analysis.text)})
+    cache_key = text_cache_key(analysis.model_dump_json())
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        # Generate main explanation
-        explanation = generate_llm_explanation(analysis)
+        # Generate main explanation in a worker thread so GPT-2 doesn't block the event loop
+        explanation, generation_failed = await asyncio.to_thread(generate_llm_explanation, analysis)
         
         # If using template, ensure it's the template version
         if USE_FALLBACK:
@@ -239,11 +304,18 @@ async def explain_analysis(analysis: AnalysisInput):
         insights = generate_insights(analysis)
         recommendations = generate_recommendations(analysis)
         
-        return ChatbotResponse(
+        response = ChatbotResponse(
             explanation=explanation,
             insights=insights,
             recommendations=recommendations
         )
+        
+        # Don't memoize a template substituted for a failed model run (e.g. a
+        # transient CUDA OOM); the next request should try the model again
+        if not generation_failed:
+            response_cache.put(cache_key, response)
+        
+        return response
     
     except Exception as e:
         print(f"Error generating explanation: {e}")
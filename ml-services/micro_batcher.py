@@ -0,0 +1,68 @@
+"""Coalesce concurrent requests into batches for model inference"""
+import asyncio
+
+
+class MicroBatcher:
+    """Collect items submitted within a short window and process them together.
+
+    ``process_batch`` receives a list of items and must return one result per
+    item, in the same order. A background task takes the first pending item,
+    waits up to ``max_wait_ms`` for more (at most ``max_batch_size`` in total),
+    then runs the batch in a worker thread and resolves each caller's future.
+    The event loop stays free to accept requests for the next batch meanwhile.
+    """
+
+    def __init__(self, process_batch, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.worker = None
+
+    async def submit(self, item):
+        """Queue an item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done() or self.worker.get_loop() is not loop:
+            # Created lazily so the queue belongs to the running loop, and again
+            # whenever the loop changes (a reload, a new test client) or the
+            # worker died; otherwise submissions would wait on a dead queue
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self._run())
+
+        future = loop.create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+
+            try:
+                results = await asyncio.to_thread(self.process_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                # Callers that disconnected leave a cancelled future behind
+                if not future.done():
+                    future.set_result(result)
@@ -1,47 +1,164 @@
+import os
+
+# OpenMP and MKL size their thread pools when torch/onnxruntime load, so these
+# must be set before the imports below, and spin-waiting threads cut wake-up
+# latency between short calls. The worker count is resolved here exactly as
+# __main__ resolves it (WEB_CONCURRENCY, default 1), so the launching process
+# and the workers that inherit its environment agree on each worker's share of
+# the cores. Launch other ways (e.g. uvicorn --workers) with WEB_CONCURRENCY set.
+WORKERS = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+THREADS_PER_WORKER = max(1, (os.cpu_count() or 4) // WORKERS)
+os.environ.setdefault('OMP_NUM_THREADS', str(THREADS_PER_WORKER))
+os.environ.setdefault('MKL_NUM_THREADS', str(THREADS_PER_WORKER))
+os.environ.setdefault('OMP_WAIT_POLICY', 'ACTIVE')
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
 import chromadb
-from chromadb.config import Settings
+import torch
 import uvicorn
+from transformers import AutoTokenizer
 from typing import List
-import os
+import numpy as np
+import threading
 
-app = FastAPI(title="RAG Truth Verification Service")
+from keyword_matcher import KeywordMatcher
+from micro_batcher import MicroBatcher
+from response_cache import LRUCache, SemanticCache, normalize_text, text_cache_key
+from torch_runtime import configure_cpu_threads
+from vector_index import HNSWLIB_AVAILABLE, FloatVectorIndex, HnswVectorIndex, Int8VectorIndex
 
-# Initialize embedding model and ChromaDB
-print("Loading embedding model and RAG system...")
 try:
-    from sentence_transformers import SentenceTransformer
-    import chromadb
-    from chromadb.config import Settings
-    
-    embedder = SentenceTransformer('all-MiniLM-L6-v2')
-    print("✅ Embedding model loaded successfully!")
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+configure_cpu_threads()
+
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+# INT8 ONNX export of the embedder, produced by export_onnx_embedder.py; the
+# service falls back to SentenceTransformer when it (or onnxruntime) is missing
+ONNX_MODEL_PATH = os.getenv('EMBEDDING_ONNX_PATH', './onnx/model_int8.onnx')
+EMBEDDING_DIM = 384
+
+# Micro-batching: requests arriving within MAX_WAIT_MS share one encoder call,
+# run in length-sorted buckets of BUCKET_SIZE to limit padding
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 10
+BUCKET_SIZE = 8
+
+# Below this many documents the float32 corpus matrix stays cache-resident and a
+# single exact GEMV is cheapest; past it, search an HNSW graph (or, without
+# hnswlib, scan an int8 copy of the corpus)
+LARGE_CORPUS_MIN_SIZE = 10_000
+HNSW_INDEX_PATH = os.getenv('RAG_HNSW_INDEX_PATH', './chroma_db/corpus_hnsw.bin')
+
+# Substrings that mark a text as suspicious when the RAG system is unavailable
+FALLBACK_TRIGGERS = ['vaccine', 'chip', '5g', 'flat earth', 'hoax']
+fallback_trigger_matcher = KeywordMatcher(FALLBACK_TRIGGERS)
+
+# Results for recently seen texts; floods of reposted claims arrive many times,
+# often with trivial edits, so near-duplicate embeddings reuse a result too
+verification_cache = LRUCache(maxsize=4096)
+semantic_cache = SemanticCache(EMBEDDING_DIM, maxsize=256, threshold=0.97)
+
+
+class OnnxEmbedder:
+    """INT8 ONNX Runtime embedder that writes into a preallocated output buffer.
+
+    Token embeddings are bound with IOBinding to a contiguous view of one flat
+    float32 buffer sized for ``max_batch`` x ``max_length`` tokens, so a call
+    does not allocate the model's largest tensor. Longer inputs run in chunks of
+    ``max_batch``. The tokenizer's int64 arrays are bound as inputs directly,
+    since copying them into another buffer would only add work.
+    """
     
-    # Modern ChromaDB initialization
-    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    def __init__(self, session, tokenizer, max_batch: int = BUCKET_SIZE, max_length: int = 256):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.max_batch = max_batch
+        self.max_length = max_length
+        self.input_names = [inp.name for inp in session.get_inputs()]
+        self.output_name = session.get_outputs()[0].name
+        self.output_buffer = np.empty(max_batch * max_length * EMBEDDING_DIM, dtype=np.float32)
+        self.binding = session.io_binding()
+        # The buffer is shared, so calls from different threads take turns
+        self.lock = threading.Lock()
     
-    # Get or create collection
-    collection = chroma_client.get_or_create_collection(
-        name="misinformation_corpus",
-        metadata={"description": "Known false narratives and verified claims"}
-    )
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into L2-normalized float32 vectors, one row per text"""
+        return np.concatenate([
+            self._embed_chunk(texts[start:start + self.max_batch])
+            for start in range(0, len(texts), self.max_batch)
+        ])
     
-    # Seed with initial data if empty
-    if collection.count() == 0:
-        print("Seeding initial knowledge corpus...")
-        seed_knowledge_base(collection)
+    def _embed_chunk(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors='np'
+        )
+        batch, seq_len = encoded['input_ids'].shape
+        mask = encoded['attention_mask'].astype(np.float32)
         
-    print(f"✅ ChromaDB initialized with {collection.count()} documents")
-    USE_FALLBACK = False
+        with self.lock:
+            for name in self.input_names:
+                self.binding.bind_cpu_input(name, np.ascontiguousarray(encoded[name], dtype=np.int64))
+            
+            token_embeddings = self.output_buffer[:batch * seq_len * EMBEDDING_DIM].reshape(
+                batch, seq_len, EMBEDDING_DIM
+            )
+            self.binding.bind_output(
+                self.output_name, 'cpu', 0, np.float32,
+                token_embeddings.shape, token_embeddings.ctypes.data
+            )
+            self.session.run_with_iobinding(self.binding)
+            
+            # Mean-pool over real tokens only, before the buffer is reused
+            summed = np.einsum('bsh,bs->bh', token_embeddings, mask)
+        
+        # Normalize like sentence-transformers
+        pooled = summed / np.clip(mask.sum(axis=1, keepdims=True), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+def load_onnx_embedder() -> OnnxEmbedder:
+    """Create the ONNX Runtime session and fast tokenizer for the INT8 embedder"""
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.intra_op_num_threads = THREADS_PER_WORKER
+    
+    session = ort.InferenceSession(ONNX_MODEL_PATH, so, providers=["CPUExecutionProvider"])
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+    return OnnxEmbedder(session, tokenizer)
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Embed texts into L2-normalized float32 vectors, one row per text"""
+    state = app.state
+    if state.onnx_embedder is not None:
+        return state.onnx_embedder.embed(texts)
+    
+    # fp16 GPU output is widened back so the index always sees float32
+    embeddings = state.embedder.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+    return embeddings.astype(np.float32, copy=False)
+
+
+def embed_batch(texts: List[str]) -> List[np.ndarray]:
+    """Embed a micro-batch of texts, returning one embedding per text"""
+    # Character length stands in for token length, saving a second tokenizer pass
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    
+    for start in range(0, len(order), BUCKET_SIZE):
+        bucket = order[start:start + BUCKET_SIZE]
+        embeddings[bucket] = embed_texts([texts[i] for i in bucket])
+    
+    return list(embeddings)
 
-except Exception as e:
-    print(f"Error loading RAG system: {e}")
-    print("Running in Fallback Mode (Simulated RAG)")
-    embedder = None
-    collection = None
-    USE_FALLBACK = True
+
+# Concurrent /analyze calls share one encoder pass
+embed_batcher = MicroBatcher(embed_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS)
 
 
 def seed_knowledge_base(collection):
@@ -97,11 +214,12 @@ def seed_knowledge_base(collection):
         },
     ]
     
-    if embedder:
+    if app.state.embedder is not None or app.state.onnx_embedder is not None:
         texts = [item["text"] for item in false_narratives]
-        embeddings = embedder.encode(texts).tolist()
+        embeddings = embed_texts(texts)
         
-        collection.add(
+        # Upsert so workers starting together on an empty store don't collide
+        collection.upsert(
             embeddings=embeddings,
             documents=texts,
             metadatas=false_narratives,
@@ -109,6 +227,81 @@ def seed_knowledge_base(collection):
         )
 
 
+def load_rag_system(state):
+    """Load the embedder and corpus index into app state, or set up fallback mode"""
+    print("Loading embedding model and RAG system...")
+    state.embedder = None
+    state.onnx_embedder = None
+    state.collection = None
+    state.corpus_index = None
+    state.use_fallback = True
+    
+    try:
+        # EMBEDDER_DEVICE=cpu keeps a GPU host on the CPU path
+        embedder_device = os.getenv('EMBEDDER_DEVICE') or ('cuda' if torch.cuda.is_available() else 'cpu')
+        
+        if embedder_device == 'cpu' and ort is not None and os.path.exists(ONNX_MODEL_PATH):
+            state.onnx_embedder = load_onnx_embedder()
+            print("✅ INT8 ONNX embedding model loaded successfully!")
+        else:
+            embedder = SentenceTransformer('all-MiniLM-L6-v2', device=embedder_device)
+            if embedder_device.startswith('cuda'):
+                # fp16 halves activation bandwidth and runs matmuls on tensor cores
+                embedder = embedder.half()
+            state.embedder = embedder
+            print(f"✅ Embedding model loaded successfully on {embedder_device}!")
+        
+        # Modern ChromaDB initialization
+        chroma_client = chromadb.PersistentClient(path="./chroma_db")
+        
+        # Get or create collection
+        collection = chroma_client.get_or_create_collection(
+            name="misinformation_corpus",
+            metadata={"description": "Known false narratives and verified claims"}
+        )
+        
+        # Seed with initial data if empty
+        if collection.count() == 0:
+            print("Seeding initial knowledge corpus...")
+            seed_knowledge_base(collection)
+        
+        # ChromaDB stays the store of record; searches run over a copy in memory
+        stored = collection.get(include=['embeddings', 'documents'])
+        if len(stored['documents']) < LARGE_CORPUS_MIN_SIZE:
+            corpus_index = FloatVectorIndex(stored['embeddings'], stored['documents'])
+        elif HNSWLIB_AVAILABLE:
+            corpus_index = HnswVectorIndex(
+                stored['embeddings'], stored['documents'], path=HNSW_INDEX_PATH, ids=stored['ids']
+            )
+        else:
+            corpus_index = Int8VectorIndex(stored['embeddings'], stored['documents'])
+        
+        state.collection = collection
+        state.corpus_index = corpus_index
+        state.use_fallback = False
+        print(f"✅ ChromaDB initialized with {collection.count()} documents")
+    
+    except Exception as e:
+        print(f"Error loading RAG system: {e}")
+        print("Running in Fallback Mode (Simulated RAG)")
+        state.embedder = None
+        state.onnx_embedder = None
+        state.collection = None
+        state.corpus_index = None
+        state.use_fallback = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models load per worker once the server starts rather than at import, so
+    # importing the module stays cheap and workers start in parallel
+    load_rag_system(app.state)
+    yield
+
+
+app = FastAPI(title="RAG Truth Verification Service", lifespan=lifespan)
+
+
 class TextInput(BaseModel):
     text: str
 
@@ -120,14 +313,46 @@ class TruthVerification(BaseModel):
     similarClaims: List[str]
 
 
+def search_similar_claims(query_embedding: np.ndarray) -> TruthVerification:
+    """Compare an embedding against the corpus and score its similarity to false narratives"""
+    similar_claims = []
+    max_similarity = 0.0
+    
+    for doc, cosine in app.state.corpus_index.query(query_embedding, k=3):
+        # Keep the scale of 1 - Chroma's default squared L2 distance, which
+        # for unit vectors is 2cos - 1
+        similarity = 2 * cosine - 1
+        similar_claims.append(doc)
+        max_similarity = max(max_similarity, similarity)
+    
+    # Determine evidence confidence based on similarity
+    if max_similarity > 0.8:
+        evidence_confidence = "High"
+        contradictory_sources = True
+    elif max_similarity > 0.5:
+        evidence_confidence = "Medium"
+        contradictory_sources = True
+    else:
+        evidence_confidence = "Low"
+        contradictory_sources = False
+    
+    return TruthVerification(
+        similarityToFalseNarratives=max_similarity,
+        evidenceConfidence=evidence_confidence,
+        contradictorySources=contradictory_sources,
+        similarClaims=similar_claims[:2]  # Return top 2
+    )
+
+
 @app.post("/analyze", response_model=TruthVerification)
 async def verify_truth(input_data: TextInput):
     """Verify truth using RAG and similarity search"""
     try:
-        if USE_FALLBACK:
+        state = app.state
+        
+        if state.use_fallback:
             # Fallback logic
-            triggers = ['vaccine', 'chip', '5g', 'flat earth', 'hoax']
-            is_suspicious = any(w in input_data.text.lower() for w in triggers)
+            is_suspicious = bool(fallback_trigger_matcher.find(input_data.text.lower()))
             
             return TruthVerification(
                 similarityToFalseNarratives=0.8 if is_suspicious else 0.1,
@@ -136,7 +361,7 @@ async def verify_truth(input_data: TextInput):
                 similarClaims=["Simulated related claim: Verified sources contradict this."] if is_suspicious else []
             )
 
-        if not embedder or not collection:
+        if (state.embedder is None and state.onnx_embedder is None) or state.corpus_index is None:
             # Fallback to mock data
             return TruthVerification(
                 similarityToFalseNarratives=0.2,
@@ -145,41 +370,25 @@ async def verify_truth(input_data: TextInput):
                 similarClaims=[]
             )
         
-        # Generate embedding for input text
-        query_embedding = embedder.encode([input_data.text])[0].tolist()
-        
-        # Search for similar claims
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=3
-        )
+        text = normalize_text(input_data.text)
         
-        similar_claims = []
-        max_similarity = 0.0
+        # Exact repeats skip the embedder and near duplicates skip the search;
+        # MiniLM's tokenizer is uncased, so case is left out of the key
+        cache_key = text_cache_key(text.lower())
+        cached = verification_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        if results['documents'] and results['documents'][0]:
-            for doc, distance in zip(results['documents'][0], results['distances'][0]):
-                similarity = 1 - distance  # Convert distance to similarity
-                similar_claims.append(doc)
-                max_similarity = max(max_similarity, similarity)
+        # Generate embedding for input text
+        query_embedding = await embed_batcher.submit(text)
         
-        # Determine evidence confidence based on similarity
-        if max_similarity > 0.8:
-            evidence_confidence = "High"
-            contradictory_sources = True
-        elif max_similarity > 0.5:
-            evidence_confidence = "Medium"
-            contradictory_sources = True
-        else:
-            evidence_confidence = "Low"
-            contradictory_sources = False
+        result = semantic_cache.get(query_embedding)
+        if result is None:
+            result = search_similar_claims(query_embedding)
+            semantic_cache.put(query_embedding, result)
         
-        return TruthVerification(
-            similarityToFalseNarratives=max_similarity,
-            evidenceConfidence=evidence_confidence,
-            contradictorySources=contradictory_sources,
-            similarClaims=similar_claims[:2]  # Return top 2
-        )
+        verification_cache.put(cache_key, result)
+        return result
     
     except Exception as e:
         print(f"Error in truth verification: {e}")
@@ -191,10 +400,16 @@ async def health_check():
     return {
         "status": "ok",
         "service": "rag-truth-verification",
-        "corpus_size": collection.count() if collection else 0
+        "corpus_size": app.state.collection.count() if app.state.collection else 0
     }
 
 
 if __name__ == "__main__":
     print("Starting RAG Truth Verification Service on port 8003...")
-    uvicorn.run(app, host="0.0.0.0", port=8003)
+    # Every worker loads its own embedder and opens ./chroma_db, so more than
+    # one is opt-in via WEB_CONCURRENCY (as start_services.sh exports it). The
+    # thread env vars set at the top of the module already reflect WORKERS and
+    # are inherited by each worker.
+    # The default 'auto' loop and http settings pick uvloop and httptools
+    # when installed (uvicorn[standard])
+    uvicorn.run("rag_service:app", host="0.0.0.0", port=8003, workers=WORKERS)
@@ -0,0 +1,75 @@
+"""Bounded in-memory caches for memoizing service responses"""
+from collections import OrderedDict
+import hashlib
+import unicodedata
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Apply NFKC normalization and strip surrounding whitespace"""
+    return unicodedata.normalize('NFKC', text).strip()
+
+
+def text_cache_key(text: str) -> bytes:
+    """Hash text into a compact fixed-size cache key"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class LRUCache:
+    """Least-recently-used cache holding at most ``maxsize`` entries"""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SemanticCache:
+    """Ring buffer of recent embeddings and their values, looked up by cosine similarity.
+
+    Embeddings must be L2-normalized so a dot product gives the cosine. A lookup
+    returns the value of the most similar stored embedding if it reaches
+    ``threshold``; once full, new entries overwrite the oldest.
+    """
+
+    def __init__(self, dim: int, maxsize: int = 256, threshold: float = 0.97):
+        self.embeddings = np.zeros((maxsize, dim), dtype=np.float32)
+        self.values = [None] * maxsize
+        self.threshold = threshold
+        self.next_slot = 0
+        self.size = 0
+
+    def get(self, embedding):
+        """Return the value stored for a near-duplicate embedding, or None"""
+        if self.size == 0:
+            return None
+        similarities = self.embeddings[:self.size] @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return self.values[best]
+        return None
+
+    def put(self, embedding, value):
+        self.embeddings[self.next_slot] = embedding
+        self.values[self.next_slot] = value
+        self.next_slot = (self.next_slot + 1) % len(self.values)
+        self.size = min(self.size + 1, len(self.values))
+
+    def __len__(self):
+        return self.size
@@ -3,6 +3,14 @@
 Write-Host "Starting ML Microservices..." -ForegroundColor Cyan
 Write-Host ""
 
+# Each service sizes its PyTorch thread pool from WEB_CONCURRENCY; keep OpenMP/MKL
+# from spawning a second pool per core on top of it
+if (-not $env:WEB_CONCURRENCY) { $env:WEB_CONCURRENCY = "1" }
+if (-not $env:OMP_NUM_THREADS) {
+    $env:OMP_NUM_THREADS = [string][Math]::Max(1, [Math]::Floor([Environment]::ProcessorCount / [int]$env:WEB_CONCURRENCY))
+}
+if (-not $env:MKL_NUM_THREADS) { $env:MKL_NUM_THREADS = $env:OMP_NUM_THREADS }
+
 # Start Emotion Detection Service (Port 8001)
 Write-Host "[1/6] Starting Emotion Detection Service (Port 8001)..." -ForegroundColor Yellow
 Start-Process python -ArgumentList "emotion_service.py" -NoNewWindow -RedirectStandardOutput "emotion_service_out.log" -RedirectStandardError "emotion_service_err.log"
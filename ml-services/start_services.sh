@@ -2,6 +2,14 @@
 
 echo "Starting all ML services..."
 
+# Each service sizes its PyTorch thread pool from WEB_CONCURRENCY; keep OpenMP/MKL
+# from spawning a second pool per core on top of it
+CPU_CORES=$(nproc 2>/dev/null || echo 4)
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+export OMP_NUM_THREADS=${OMP_NUM_THREADS:-$(( CPU_CORES / WEB_CONCURRENCY > 0 ? CPU_CORES / WEB_CONCURRENCY : 1 ))}
+export MKL_NUM_THREADS=${MKL_NUM_THREADS:-$OMP_NUM_THREADS}
+export KMP_AFFINITY=${KMP_AFFINITY:-granularity=fine,compact,1,0}
+
 # Start emotion service
 echo "Starting emotion detection service on port 8001..."
 python emotion_service.py &
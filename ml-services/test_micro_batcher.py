@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+
+from micro_batcher import MicroBatcher
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def test_batches_concurrent_submissions(self):
+        batch_sizes = []
+
+        def process(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=20)
+
+        async def submit_all():
+            return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+        self.assertEqual(asyncio.run(submit_all()), [0, 2, 4, 6, 8])
+        self.assertEqual(batch_sizes, [5])
+
+    def test_submits_from_separate_event_loops(self):
+        batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_wait_ms=1)
+
+        async def submit(value):
+            return await asyncio.wait_for(batcher.submit(value), timeout=2)
+
+        self.assertEqual(asyncio.run(submit(1)), 2)
+        self.assertEqual(asyncio.run(submit(2)), 3)
+
+    def test_exception_reaches_every_caller(self):
+        def fail(items):
+            raise ValueError("boom")
+
+        batcher = MicroBatcher(fail, max_wait_ms=1)
+
+        async def submit():
+            return await asyncio.wait_for(batcher.submit(1), timeout=2)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(submit())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,43 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import List, Dict
+from statistics import fmean
+from typing import List, Dict, Tuple
+import functools
 import uvicorn
+import os
 
-app = FastAPI(title="Time-Series Analysis Service")
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+from keyword_matcher import KeywordMatcher
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile the numba trend kernel before serving (float64, the dtype of the
+    # historical series) so the first /analyze request doesn't pay for it
+    trend_stats(np.linspace(0.0, 1.0, 16))
+    yield
+
+
+app = FastAPI(title="Time-Series Analysis Service", lifespan=lifespan)
+
+# Seed for the simulated historical data, shared by all worker processes
+TIMESERIES_SEED = int(os.getenv('TIMESERIES_SEED', '42'))
+
+# Keywords per category for the fallback categorizer
+FALLBACK_CATEGORY_KEYWORDS = {
+    'vaccine_misinfo': ['vaccine', 'vaccination', 'immunization'],
+    'health_misinfo': ['cure', 'treatment', 'poison', 'toxic'],
+    'conspiracy': ['they', 'control', 'secret', 'hiding'],
+    'political_misinfo': ['election', 'vote', 'rigged'],
+    'social_misinfo': ['attack', 'threat', 'community'],
+}
 
 # Initialize time-series data
 print("Loading time-series analysis system...")
@@ -48,26 +79,36 @@ try:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=90)
         dates = pd.date_range(start=start_date, end=end_date, freq='D')
+        days_from_start = np.arange(len(dates))
+        # Seeded so every worker process generates the same history and the
+        # same text gets the same trends whichever worker serves it
+        rng = np.random.default_rng(TIMESERIES_SEED)
         
-        data = []
+        # Harm levels per category as date-sorted arrays, so analyze_trend runs a
+        # few NumPy reductions instead of filtering the DataFrame per request
+        series = {}
+        frames = []
         for category, config in categories.items():
-            for date in dates:
-                # Simulate trend with some randomness
-                days_from_start = (date - start_date).days
-                trend = config['baseline'] + np.sin(days_from_start / 15) * 0.1
-                noise = np.random.normal(0, config['volatility'] * 0.1)
-                value = max(0, min(1, trend + noise))
-                
-                data.append({
-                    'date': date,
-                    'category': category,
-                    'harm_level': value,
-                    'volume': int(np.random.exponential(100) * (1 + value))
-                })
+            # Simulate trend with some randomness, a whole category at a time
+            trend = config['baseline'] + np.sin(days_from_start / 15) * 0.1
+            noise = rng.normal(0, config['volatility'] * 0.1, len(dates))
+            harm_levels = np.clip(trend + noise, 0, 1)
+            volumes = (rng.exponential(100, len(dates)) * (1 + harm_levels)).astype(np.int64)
+            
+            series[category] = harm_levels
+            frames.append(pd.DataFrame({
+                'date': dates,
+                'category': category,
+                'harm_level': harm_levels,
+                'volume': volumes
+            }))
         
-        return pd.DataFrame(data), categories
+        return pd.concat(frames, ignore_index=True), series, categories
     
-    historical_df, categories_config = create_historical_database()
+    historical_df, category_series, categories_config = create_historical_database()
+    category_keywords = {
+        category: config['keywords'] for category, config in categories_config.items()
+    }
     print(f"Time-series database initialized with {len(historical_df)} records")
     USE_FALLBACK = False
     
@@ -76,9 +117,78 @@ except Exception as e:
     print("Running in Fallback Mode (Simulated trends)")
     historical_df = None
     categories_config = None
+    category_keywords = None
+    category_series = None
     USE_FALLBACK = True
 
 
+def _trend_stats(harm_levels):
+    """Return (current_level, recent_avg, older_avg, volatility, recent_max, q90).
+
+    current_level, volatility and recent_max cover the last 7 days, recent_avg the
+    last 3, older_avg the 7 days before those (tail(14).head(7)), and q90 is the
+    linearly interpolated 90th percentile of the whole series. Expects at least
+    two values.
+    """
+    n = len(harm_levels)
+    recent_start = max(0, n - 7)
+    older_start = max(0, n - 14)
+    older_end = min(older_start + 7, n)
+    
+    total = 0.0
+    total_sq = 0.0
+    recent_max = harm_levels[recent_start]
+    for i in range(recent_start, n):
+        value = harm_levels[i]
+        total += value
+        total_sq += value * value
+        recent_max = max(recent_max, value)
+    count = n - recent_start
+    current_level = total / count
+    volatility = np.sqrt(max(total_sq - count * current_level * current_level, 0.0) / (count - 1))
+    
+    recent_avg = harm_levels[max(0, n - 3):].mean()
+    older_avg = harm_levels[older_start:older_end].mean()
+    q90 = np.quantile(harm_levels, 0.9)
+    
+    return current_level, recent_avg, older_avg, volatility, recent_max, q90
+
+
+# All trend statistics come from one compiled pass instead of separate NumPy calls
+trend_stats = njit(cache=True, fastmath=True)(_trend_stats) if njit is not None else _trend_stats
+
+
+class CategoryIndex:
+    """Flat lookup tables for keyword categorization.
+
+    Category names sit in one tuple, each keyword maps to the ids of the
+    categories it belongs to, and every keyword is compiled into one matcher,
+    so a text is scanned once and only the keywords it contains are looked at.
+    """
+    
+    def __init__(self, category_keywords: Dict[str, List[str]]):
+        self.names = tuple(category_keywords)
+        keyword_ids = {}
+        for category_id, keywords in enumerate(category_keywords.values()):
+            for keyword in keywords:
+                keyword_ids.setdefault(keyword, []).append(category_id)
+        self.keyword_ids = {kw: tuple(ids) for kw, ids in keyword_ids.items()}
+        self.matcher = KeywordMatcher(self.keyword_ids)
+    
+    def categorize(self, text_lower: str) -> Tuple[str, ...]:
+        """Return matched category names in configured order"""
+        hit_ids = {
+            category_id
+            for kw in self.matcher.find(text_lower)
+            for category_id in self.keyword_ids[kw]
+        }
+        return tuple(self.names[i] for i in sorted(hit_ids))
+
+
+fallback_category_index = CategoryIndex(FALLBACK_CATEGORY_KEYWORDS)
+category_index = CategoryIndex(category_keywords or {})
+
+
 class TextInput(BaseModel):
     text: str
 
@@ -99,39 +209,28 @@ class TimeSeriesAnalysis(BaseModel):
     similar_incidents: List[Dict[str, str]]
 
 
-def categorize_text(text: str) -> List[str]:
-    """Categorize text based on keywords"""
+@functools.lru_cache(maxsize=2048)
+def categorize_text(text: str) -> Tuple[str, ...]:
+    """Categorize text based on keywords (memoized; reposted texts repeat often)"""
     if USE_FALLBACK or categories_config is None:
         # Simple fallback categorization
-        text_lower = text.lower()
-        categories = []
-        
-        if any(w in text_lower for w in ['vaccine', 'vaccination', 'immunization']):
-            categories.append('vaccine_misinfo')
-        if any(w in text_lower for w in ['cure', 'treatment', 'poison', 'toxic']):
-            categories.append('health_misinfo')
-        if any(w in text_lower for w in ['they', 'control', 'secret', 'hiding']):
-            categories.append('conspiracy')
-        if any(w in text_lower for w in ['election', 'vote', 'rigged']):
-            categories.append('political_misinfo')
-        if any(w in text_lower for w in ['attack', 'threat', 'community']):
-            categories.append('social_misinfo')
-        
-        return categories if categories else ['general']
-    
-    text_lower = text.lower()
-    detected = []
+        index = fallback_category_index
+    else:
+        index = category_index
     
-    for category, config in categories_config.items():
-        if any(keyword in text_lower for keyword in config['keywords']):
-            detected.append(category)
+    detected = index.categorize(text.lower())
     
-    return detected if detected else ['general']
+    return detected if detected else ('general',)
 
 
+@functools.lru_cache(maxsize=None)
 def analyze_trend(category: str) -> TrendData:
-    """Analyze trend for a specific category"""
-    if USE_FALLBACK or historical_df is None:
+    """Analyze trend for a specific category.
+
+    The historical series are built once at startup and never change, so each
+    category's result is computed once and reused.
+    """
+    if USE_FALLBACK or category_series is None:
         # Fallback trend data
         return TrendData(
             category=category,
@@ -141,10 +240,9 @@ def analyze_trend(category: str) -> TrendData:
             recent_spike=False
         )
     
-    # Filter data for category
-    category_data = historical_df[historical_df['category'] == category].sort_values('date')
+    harm_levels = category_series.get(category)
     
-    if len(category_data) == 0:
+    if harm_levels is None or len(harm_levels) == 0:
         return TrendData(
             category=category,
             current_level=0.3,
@@ -153,40 +251,38 @@ def analyze_trend(category: str) -> TrendData:
             recent_spike=False
         )
     
-    # Get recent data (last 7 days)
-    recent_data = category_data.tail(7)
-    current_level = recent_data['harm_level'].mean()
+    if len(harm_levels) < 2:
+        return TrendData(
+            category=category,
+            current_level=round(float(harm_levels[0]), 3),
+            trend_direction="stable",
+            volatility=0.0,
+            recent_spike=False
+        )
+    
+    current_level, recent_avg, older_avg, volatility, recent_max, q90 = trend_stats(harm_levels)
     
     # Calculate trend direction
-    if len(recent_data) >= 2:
-        recent_avg = recent_data.tail(3)['harm_level'].mean()
-        older_avg = category_data.tail(14).head(7)['harm_level'].mean()
-        
-        if recent_avg > older_avg * 1.1:
-            trend_direction = "increasing"
-        elif recent_avg < older_avg * 0.9:
-            trend_direction = "decreasing"
-        else:
-            trend_direction = "stable"
+    if recent_avg > older_avg * 1.1:
+        trend_direction = "increasing"
+    elif recent_avg < older_avg * 0.9:
+        trend_direction = "decreasing"
     else:
         trend_direction = "stable"
     
-    # Calculate volatility
-    volatility = recent_data['harm_level'].std()
-    
     # Detect recent spike
-    recent_spike = recent_data['harm_level'].max() > category_data['harm_level'].quantile(0.9)
+    recent_spike = recent_max > q90
     
     return TrendData(
         category=category,
-        current_level=round(current_level, 3),
+        current_level=round(float(current_level), 3),
         trend_direction=trend_direction,
-        volatility=round(volatility, 3),
-        recent_spike=recent_spike
+        volatility=round(float(volatility), 3),
+        recent_spike=bool(recent_spike)
     )
 
 
-def generate_historical_context(categories: List[str], trends: List[TrendData]) -> str:
+def generate_historical_context(categories: Tuple[str, ...], trends: List[TrendData]) -> str:
     """Generate historical context narrative"""
     if not trends:
         return "No significant historical patterns detected for this type of content."
@@ -194,20 +290,21 @@ def generate_historical_context(categories: List[str], trends: List[TrendData])
     context_parts = []
     
     for trend in trends:
+        label = trend.category.replace('_', ' ').title()
         if trend.trend_direction == "increasing":
             context_parts.append(
-                f"📈 **{trend.category.replace('_', ' ').title()}**: "
+                f"📈 **{label}**: "
                 f"Currently trending upward (level: {int(trend.current_level*100)}%). "
                 f"This type of misinformation has seen increased activity in recent days."
             )
         elif trend.recent_spike:
             context_parts.append(
-                f"⚠️ **{trend.category.replace('_', ' ').title()}**: "
+                f"⚠️ **{label}**: "
                 f"Recent spike detected. Similar claims have shown elevated harm levels recently."
             )
         else:
             context_parts.append(
-                f"📊 **{trend.category.replace('_', ' ').title()}**: "
+                f"📊 **{label}**: "
                 f"Baseline activity (level: {int(trend.current_level*100)}%). "
                 f"Trend is {trend.trend_direction}."
             )
@@ -220,10 +317,13 @@ def generate_risk_forecast(trends: List[TrendData]) -> str:
     if not trends:
         return "Insufficient data for risk forecasting."
     
-    # Calculate overall risk
-    increasing_trends = sum(1 for t in trends if t.trend_direction == "increasing")
-    recent_spikes = sum(1 for t in trends if t.recent_spike)
-    avg_level = np.mean([t.current_level for t in trends])
+    # Calculate overall risk in one pass over the trends
+    increasing_trends = 0
+    recent_spikes = 0
+    for t in trends:
+        increasing_trends += t.trend_direction == "increasing"
+        recent_spikes += t.recent_spike
+    avg_level = fmean(t.current_level for t in trends)
     
     if recent_spikes > 0 or increasing_trends >= 2:
         forecast = "🔴 **High Risk Period**: Multiple indicators suggest elevated misinformation activity. "
@@ -238,7 +338,7 @@ def generate_risk_forecast(trends: List[TrendData]) -> str:
     return forecast
 
 
-def find_similar_incidents(categories: List[str]) -> List[Dict[str, str]]:
+def find_similar_incidents(categories: Tuple[str, ...]) -> List[Dict[str, str]]:
     """Find similar historical incidents"""
     incidents = [
         {
@@ -323,4 +423,12 @@ async def health_check():
 
 if __name__ == "__main__":
     print("Starting Time-Series Analysis Service on port 8006...")
-    uvicorn.run(app, host="0.0.0.0", port=8006)
+    # One worker unless WEB_CONCURRENCY asks for more, matching rag_service and
+    # the start scripts; extra workers re-import this module and inherit the
+    # env vars that size their share of the CPU
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    os.environ.setdefault('OMP_NUM_THREADS', str(max(1, (os.cpu_count() or 1) // workers)))
+    
+    # The default 'auto' loop and http settings pick uvloop and httptools
+    # when installed (uvicorn[standard])
+    uvicorn.run("timeseries_service:app", host="0.0.0.0", port=8006, workers=workers)
@@ -0,0 +1,68 @@
+"""PyTorch CPU runtime settings shared by the model-serving services"""
+import functools
+import os
+
+import torch
+
+
+def configure_cpu_threads():
+    """Split CPU cores evenly between Uvicorn workers.
+
+    PyTorch defaults every process to one intra-op thread per core, so several
+    workers on one machine oversubscribe the CPU. WEB_CONCURRENCY is the worker
+    count Uvicorn and Gunicorn read. Must run before any parallel torch work.
+    Safe to call again in the same process (e.g. importing several services).
+    """
+    cores = os.cpu_count() or 4
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    torch.set_num_threads(max(1, cores // workers))
+    # The inter-op pool can only be sized once per process; a second call raises
+    if torch.get_num_interop_threads() != 1:
+        torch.set_num_interop_threads(1)
+
+
+@functools.lru_cache(maxsize=1)
+def cpu_flags():
+    """Return the CPU feature flags reported by /proc/cpuinfo (empty if unavailable).
+
+    Only Linux has /proc/cpuinfo; this is a fallback for torch builds that lack
+    the torch.cpu feature probes used first below.
+    """
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return frozenset(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return frozenset()
+
+
+def _torch_cpu_supports(*probes):
+    """Ask torch's own CPU feature probes (any platform); False if none are available"""
+    for name in probes:
+        probe = getattr(torch.cpu, name, None)
+        try:
+            if probe is not None and probe():
+                return True
+        except Exception:
+            pass
+    return False
+
+
+def supports_int8_matmul():
+    """Check for VNNI int8 instructions, without which dynamic quantization can regress"""
+    if 'fbgemm' not in torch.backends.quantized.supported_engines:
+        return False
+    if _torch_cpu_supports('_is_avx512_vnni_supported', '_is_amx_tile_supported'):
+        return True
+    return not cpu_flags().isdisjoint({'avx512_vnni', 'avx_vnni'})
+
+
+def supports_bf16_matmul():
+    """Check for native bf16 matmul instructions (AVX512-BF16 or AMX)"""
+    if not torch.backends.mkldnn.is_available():
+        return False
+    if _torch_cpu_supports('_is_avx512_bf16_supported', '_is_amx_tile_supported'):
+        return True
+    return not cpu_flags().isdisjoint({'avx512_bf16', 'amx_bf16'})
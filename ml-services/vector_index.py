@@ -0,0 +1,193 @@
+"""In-memory nearest-neighbour search over a fixed corpus of embeddings"""
+import hashlib
+import os
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+HNSWLIB_AVAILABLE = hnswlib is not None
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _int8_dot_scores(corpus, query):
+        """int32 dot product of every int8 corpus row with an int8 query"""
+        n, d = corpus.shape
+        scores = np.empty(n, dtype=np.int32)
+        for i in prange(n):
+            acc = np.int32(0)
+            for j in range(d):
+                acc += np.int32(corpus[i, j]) * np.int32(query[j])
+            scores[i] = acc
+        return scores
+else:
+    def _int8_dot_scores(corpus, query):
+        """int32 dot product of every int8 corpus row with an int8 query"""
+        return corpus.astype(np.int32) @ query.astype(np.int32)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Symmetrically quantize vectors to int8 with one scale for the whole array"""
+    scale = float(np.abs(vectors).max()) / 127 if vectors.size else 0.0
+    scale = scale or 1.0
+    quantized = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return quantized, scale
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class FloatVectorIndex:
+    """Exact cosine search over a contiguous float32 matrix of normalized embeddings.
+
+    Scoring a query is one BLAS matrix-vector product, which for small corpora
+    beats both ANN index plumbing and int8 quantization overhead.
+    """
+
+    def __init__(self, embeddings: np.ndarray, documents):
+        self.documents = list(documents or [])
+        if not self.documents:
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        corpus = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(corpus, axis=1, keepdims=True)
+        self.corpus = corpus / np.clip(norms, 1e-12, None)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def query(self, embedding: np.ndarray, k: int = 3):
+        """Return the top-k (document, cosine similarity) pairs, best first"""
+        if not self.documents:
+            return []
+
+        similarities = self.corpus @ np.asarray(embedding, dtype=np.float32)
+        top = top_k(similarities, k)
+        return [(self.documents[i], float(similarities[i])) for i in top]
+
+
+class Int8VectorIndex:
+    """Exact inner-product search over int8-quantized, L2-normalized embeddings.
+
+    Rows are stored as a contiguous int8 matrix (4x smaller than float32) and
+    scored with integer dot products, then rescaled to cosine similarity. A single
+    scale per side keeps the dot product purely integer; per-dimension scales
+    would need a float multiply per element.
+    """
+
+    def __init__(self, embeddings: np.ndarray, documents):
+        self.documents = list(documents or [])
+        if not self.documents:
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        self.corpus, self.scale = quantize_int8(np.asarray(embeddings, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def query(self, embedding: np.ndarray, k: int = 3):
+        """Return the top-k (document, cosine similarity) pairs, best first"""
+        if not self.documents:
+            return []
+
+        query, query_scale = quantize_int8(np.asarray(embedding, dtype=np.float32))
+        scores = _int8_dot_scores(self.corpus, query)
+
+        top = top_k(scores, k)
+
+        similarities = scores[top] * (self.scale * query_scale)
+        return [(self.documents[i], float(s)) for i, s in zip(top, similarities)]
+
+
+def corpus_fingerprint(ids, documents, vectors: np.ndarray) -> str:
+    """Hash a corpus's ids, documents and embeddings to detect any change to it"""
+    digest = hashlib.blake2b(digest_size=16)
+    for value in list(ids or []) + list(documents):
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def _write_atomically(path: str, write):
+    """Call write(tmp_path) and move the result into place in one step"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class HnswVectorIndex:
+    """Approximate cosine search over an hnswlib HNSW graph, for large corpora.
+
+    The graph is loaded from ``path`` when the fingerprint saved beside it
+    matches the corpus (ids, documents and embeddings); otherwise it is built
+    from the embeddings and saved there. Files are written to a temporary name
+    and renamed into place, so workers building concurrently never leave a
+    torn index. Labels are row positions in ``documents``.
+    """
+
+    def __init__(self, embeddings: np.ndarray, documents, path: str = None, ids=None,
+                 m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        self.documents = list(documents or [])
+        self.index = None
+        if not self.documents:
+            return
+
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        fingerprint = corpus_fingerprint(ids, self.documents, vectors)
+        self.index = hnswlib.Index(space='cosine', dim=vectors.shape[1])
+
+        if path and self._saved_fingerprint(path) == fingerprint and os.path.exists(path):
+            self.index.load_index(path)
+        else:
+            self._build(vectors, path, fingerprint, m, ef_construction)
+
+        self.index.set_ef(ef_search)
+
+    @staticmethod
+    def _saved_fingerprint(path):
+        try:
+            with open(f"{path}.fingerprint") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _build(self, vectors, path, fingerprint, m, ef_construction):
+        self.index.init_index(max_elements=len(vectors), M=m, ef_construction=ef_construction)
+        self.index.add_items(vectors, np.arange(len(vectors)))
+        if path:
+            def write_fingerprint(tmp_path):
+                with open(tmp_path, 'w') as f:
+                    f.write(fingerprint)
+
+            _write_atomically(path, self.index.save_index)
+            _write_atomically(f"{path}.fingerprint", write_fingerprint)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def query(self, embedding: np.ndarray, k: int = 3):
+        """Return the top-k (document, cosine similarity) pairs, best first"""
+        if not self.documents:
+            return []
+
+        labels, distances = self.index.knn_query(
+            np.asarray(embedding, dtype=np.float32), k=min(k, len(self.documents))
+        )
+        # hnswlib's cosine space reports 1 - cosine similarity
+        return [(self.documents[i], 1.0 - float(d)) for i, d in zip(labels[0], distances[0])]